@@ -5,18 +5,32 @@
 使い方:
     python generate_catalog.py HAK                    # 仕入先コード指定
     python generate_catalog.py HAK --excel data.xlsx  # Excelファイル指定
+    python generate_catalog.py --server < codes.txt   # 標準入力の仕入先コードを連続生成
 """
 
 import argparse
-import copy
+import contextlib
+import functools
 import io
 import os
+import re
+import sys
 from pathlib import Path
 from datetime import datetime
 
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from lxml import etree
 from PIL import Image
 from pptx import Presentation
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+from pptx.opc.package import PartFactory
+from pptx.opc.packuri import PackURI
+from pptx.opc.spec import image_content_types
+from pptx.oxml import parse_xml
+from pptx.oxml.ns import nsmap
+from pptx.parts.image import Image as PptxImage, ImagePart
 from pptx.util import Inches
 
 
@@ -28,291 +42,570 @@ DEFAULT_OUTPUT_DIR = 'output'
 
 PRODUCTS_PER_PAGE = 2
 
+# 対応画像形式（同じ商品に複数ある場合は先頭を優先）
+IMAGE_EXTS = ['.jpg', '.png', '.webp']
 
-def extract_supplier_code(product_id):
-    """商品連番から仕入先コードを抽出"""
-    if pd.isna(product_id):
-        return None
-    parts = str(product_id).split('_')
-    return parts[2] if len(parts) >= 3 else None
+# 価格列名（改行を含む）
+PRICE_COL = '国内定価\n（15％）'
+MSRP_COL = '参考上代\n（税込)'
+PRICE_COLS = [PRICE_COL, MSRP_COL]
+
+# 商品マスタから読み込む列（カタログで使う列のみ）
+USED_COLS = [
+    '商品連番', '商品名', '仕入先', '容量', '単位', '発注ロット', '温度帯', '賞味期限',
+    PRICE_COL, MSRP_COL, '商品特徴',
+]
+
+# ページ生成で使う列（行データはこの順のタプル）と各列の位置
+PRODUCT_COLS = [
+    '商品連番', '商品名', '容量', '単位', '発注ロット', '温度帯', '賞味期限',
+    PRICE_COL, MSRP_COL, '商品特徴',
+]
+COL = {col: i for i, col in enumerate(PRODUCT_COLS)}
+
+# 商品ごとのプレースホルダー項目と、商品番号（1ページ内の位置）別のキー
+FIELDS = ['商品名', '容量', '単位', 'MOQ', '温度帯', '賞味期限', '価格', '参考上代', '商品説明']
+KEYS_BY_NUM = {
+    num: {field: f'{{{{{field}_{num}}}}}' for field in FIELDS + ['画像']}
+    for num in range(1, PRODUCTS_PER_PAGE + 1)
+}
+
+# プレースホルダー形式 {{...}}
+PLACEHOLDER_RE = re.compile(r'\{\{[^{}]+\}\}')
+
+# シェイプ内の全runのテキスト（文書順）を取り出すXPath（コンパイル済み）
+RUN_TEXTS_XPATH = etree.XPath(
+    './p:txBody/a:p/a:r/a:t/text()', namespaces=nsmap('a', 'p'), smart_strings=False,
+)
+
+# Parquetキャッシュのメタデータに保存する元Excelの更新時刻キー
+CACHE_MTIME_KEY = b'source_mtime_ns'
+
+
+def is_missing(val):
+    """欠損値（None・NaN・pd.NA）か判定"""
+    # pd.isna より軽い判定（NaNは自身と等しくない。pd.NA は比較できないため先に判定）
+    return val is None or val is pd.NA or val != val
 
 
 def safe_str(val, default='－'):
     """NaN安全な文字列変換"""
-    if pd.isna(val):
+    if is_missing(val):
         return default
     return str(val)
 
 
 def format_price(val):
-    """価格フォーマット"""
-    if pd.isna(val):
+    """価格フォーマット（円未満は切り捨て）"""
+    if is_missing(val):
         return '－'
     return f"¥{int(val):,}"
 
 
-def load_data(excel_path, supplier_code):
-    """Excelからデータ読み込み"""
-    df = pd.read_excel(excel_path, sheet_name='商品マスタ', header=1)
-    df['仕入先コード'] = df['商品連番'].apply(extract_supplier_code)
-    
-    products = df[(df['仕入先コード'] == supplier_code) & (df['商品名'].notna())].copy()
+def read_master(excel_path):
+    """
+    商品マスタ読み込み（Parquetキャッシュ付き）
+    Excelと同じ場所の .parquet を、Excelの更新時刻が一致する場合のみ再利用する
+    """
+    cache_path = Path(excel_path).with_suffix('.parquet')
+    mtime_ns = str(os.stat(excel_path).st_mtime_ns).encode()
+
+    if cache_path.exists():
+        try:
+            schema = pq.read_schema(cache_path)
+            metadata = schema.metadata or {}
+            # 列構成が変わった・価格列が数値でない古いキャッシュは作り直す。読むのは使う列のみ
+            if (metadata.get(CACHE_MTIME_KEY) == mtime_ns and set(USED_COLS) <= set(schema.names)
+                    and all(pa.types.is_floating(schema.field(col).type) for col in PRICE_COLS)):
+                return pq.read_table(cache_path, columns=USED_COLS).to_pandas()
+        except (pa.ArrowException, OSError) as e:
+            # 壊れたキャッシュ（書き込み途中の中断など）は使わずにExcelから作り直す
+            print(f"警告: キャッシュを読み込めません（再作成します）: {e}")
+
+    # calamine（Rust実装）で必要な列のみ読み込む
+    df = pd.read_excel(
+        excel_path, sheet_name='商品マスタ', header=1,
+        engine='calamine', usecols=USED_COLS,
+    )
+    # 価格列は数値のまま保つ（「オープン」などの文字列は欠損扱いにして警告）
+    for col in PRICE_COLS:
+        prices = pd.to_numeric(df[col], errors='coerce').astype('float64')
+        invalid = prices.isna() & df[col].notna()
+        if invalid.any():
+            label = col.replace('\n', '')
+            print(f"警告: {label} の数値でない値{invalid.sum()}件は「－」で表示します")
+        df[col] = prices
+    # 数値と文字列が混在する表示用の列（容量・発注ロットなど）は文字列に揃える
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].astype('string')
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    table = table.replace_schema_metadata({
+        **(table.schema.metadata or {}),
+        CACHE_MTIME_KEY: mtime_ns,
+    })
+    # 同じディレクトリの一時ファイルに書いてから置き換える
+    # （中断や同時実行で書きかけのキャッシュが読まれないようにする）
+    tmp_path = cache_path.with_name(f'.{cache_path.name}.{os.getpid()}.tmp')
+    try:
+        pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, cache_path)
+    except (pa.ArrowException, OSError) as e:
+        print(f"警告: キャッシュを書き込めません: {e}")
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+    return df
+
+
+def select_products(df, supplier_code):
+    """商品マスタから仕入先の商品を抽出"""
+    # 商品連番 PRD_SNJ_{仕入先コード}_{連番}_{版} の3番目が一致する行に絞り込む
+    # （全行の仕入先コード列は作らない）
+    pattern = rf'[^_]*_[^_]*_{re.escape(supplier_code)}(?:_|$)'
+    mask = df['商品連番'].astype('string').str.match(pattern, na=False)
+    products = df.loc[mask & df['商品名'].notna()].copy()
     supplier_name = products['仕入先'].iloc[0] if len(products) > 0 else supplier_code
     
     return products, supplier_name
 
 
-def replace_text_in_paragraph(paragraph, replacements):
+@functools.lru_cache(maxsize=None)
+def compile_placeholders(keys):
+    """プレースホルダー群を1つの正規表現にまとめる（キー集合ごとにキャッシュ）"""
+    # 長いキーを優先してマッチさせる
+    return re.compile('|'.join(re.escape(k) for k in sorted(keys, key=len, reverse=True)))
+
+
+def replace_text_in_paragraph(paragraph, replacements, pattern):
     """
     パラグラフ内のテキストを置換（run分割対応版）
     複数runに分割されたプレースホルダーも正しく置換する
     """
     # 全runのテキストを結合
-    full_text = ''.join([run.text for run in paragraph.runs])
+    runs = paragraph.runs
+    full_text = ''.join([run.text for run in runs])
     
-    # 置換が必要かチェック
-    new_text = full_text
-    for key, value in replacements.items():
-        if key in new_text:
-            new_text = new_text.replace(key, value)
+    # 全プレースホルダーを1回の走査で置換
+    new_text = pattern.sub(lambda m: replacements[m.group(0)], full_text)
     
     # 変更があった場合のみ書き戻す
     if new_text != full_text:
         # 最初のrunにテキスト全体を入れ、残りは空に
-        if paragraph.runs:
-            paragraph.runs[0].text = new_text
-            for run in paragraph.runs[1:]:
+        if runs:
+            runs[0].text = new_text
+            for run in runs[1:]:
                 run.text = ''
 
 
-def replace_text_in_shape(shape, replacements):
+def replace_text_in_shape(shape, replacements, pattern):
     """シェイプ内のテキストを置換"""
     if shape.has_text_frame:
         for paragraph in shape.text_frame.paragraphs:
-            replace_text_in_paragraph(paragraph, replacements)
+            replace_text_in_paragraph(paragraph, replacements, pattern)
 
 
-def replace_text_in_table(table, replacements):
+def replace_text_in_table(table, replacements, pattern):
     """テーブル内のテキストを置換"""
     for row in table.rows:
         for cell in row.cells:
             for paragraph in cell.text_frame.paragraphs:
-                replace_text_in_paragraph(paragraph, replacements)
+                replace_text_in_paragraph(paragraph, replacements, pattern)
 
 
-def convert_image_for_pptx(image_path):
-    """画像をpython-pptx対応形式に変換（WebP→PNG）"""
-    ext = os.path.splitext(image_path)[1].lower()
-    if ext == '.webp':
-        img = Image.open(image_path)
-        img_bytes = io.BytesIO()
-        img.save(img_bytes, format='PNG')
-        img_bytes.seek(0)
-        return img_bytes
-    return image_path
+def register_webp_support():
+    """
+    python-pptxにWebP形式を登録（変換せずそのまま埋め込めるようにする）
+    内部のテーブルを書き換えるため、対応するpython-pptxは 1.0.x のみ
+    """
+    if 'webp' in image_content_types:
+        return
+    image_content_types['webp'] = 'image/webp'
+    PartFactory.part_type_for['image/webp'] = ImagePart
+    original_ext = PptxImage.ext
 
+    def ext(self):
+        if self._format == 'WEBP':
+            return 'webp'
+        return original_ext.__get__(self, PptxImage)
 
-def find_and_replace_image(slide, placeholder_text, image_path):
-    """画像プレースホルダーを実画像で置換（アスペクト比維持）"""
-    if not os.path.exists(image_path):
-        return False
+    PptxImage.ext = property(ext)
 
-    image_data = convert_image_for_pptx(image_path)
 
-    # 画像のサイズを取得
-    img = Image.open(image_path)
-    img_width, img_height = img.size
+def convert_image_for_pptx(image_path, webp_to_png=False):
+    """
+    画像ファイルを1回だけ読み込み、python-pptxの画像とサイズを返す
+    （画像本体を保持するためキャッシュしない。同じ画像の重複は cached_image_parts で除く）
+    戻り値: (pptx画像, 幅, 高さ)
+    WebPは通常そのまま埋め込む（PowerPoint 2019以前向けにはPNGへ変換）
+    """
+    # 読み込んだバイト列をそのまま place_image で埋め込むため、ファイルを開くのはここだけ
+    # （サイズはpython-pptxがヘッダーから取得する値を使う）
+    image = PptxImage.from_file(image_path)
+    if webp_to_png and os.path.splitext(image_path)[1].lower() == '.webp':
+        # 圧縮率より速度を優先（ICCプロファイルは色再現に必要なため残す）
+        with Image.open(io.BytesIO(image.blob)) as img:
+            img_bytes = io.BytesIO()
+            img.save(img_bytes, format='PNG', optimize=False, compress_level=1)
+        image = PptxImage.from_blob(img_bytes.getvalue())
+    img_width, img_height = image.size
+    return image, img_width, img_height
+
+
+def index_images(images_dir):
+    """画像ディレクトリを1回走査し、{商品連番: 画像パス} を作成"""
+    if not os.path.isdir(images_dir):
+        return {}
+
+    entries = []
+    with os.scandir(images_dir) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext in IMAGE_EXTS and entry.is_file():
+                entries.append((IMAGE_EXTS.index(ext), stem, entry.path))
+
+    index = {}
+    for _, stem, path in sorted(entries):
+        index.setdefault(stem, path)
+    return index
+
+
+def index_slide(slide):
+    """
+    スライドを1回走査し、プレースホルダーを含むシェイプの索引を作成
+    戻り値: {プレースホルダー: シェイプ}（同じプレースホルダーは最初のシェイプを優先）
+    """
+    index = {}
+    for shape in slide.shapes:
+        # 全runを結合してチェック（テキストの取り出しはXPathでまとめて行う）
+        text = ''.join(RUN_TEXTS_XPATH(shape.element))
+        for placeholder in PLACEHOLDER_RE.findall(text):
+            index.setdefault(placeholder, shape)
+    return index
+
+
+def fit_image(index, placeholder_text, image_path, webp_to_png=False):
+    """
+    画像プレースホルダーに収まる配置を計算（アスペクト比維持）
+    戻り値: (プレースホルダーのシェイプ, pptx画像, left, top, width, height) / 該当なしは None
+    画像パスは index_images の走査結果なので、ここでは存在確認しない
+    """
+    shape = index.get(placeholder_text)
+    if shape is None:
+        return None
+
+    image, img_width, img_height = convert_image_for_pptx(image_path, webp_to_png)
     img_aspect = img_width / img_height
 
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            # 全runを結合してチェック
-            text = ''.join([
-                ''.join([run.text for run in p.runs])
-                for p in shape.text_frame.paragraphs
-            ])
-            if placeholder_text in text:
-                placeholder_left, placeholder_top = shape.left, shape.top
-                placeholder_width, placeholder_height = shape.width, shape.height
-                placeholder_aspect = placeholder_width / placeholder_height
-
-                # アスペクト比を維持してプレースホルダー内に収める
-                if img_aspect > placeholder_aspect:
-                    # 画像が横長 → 幅に合わせる
-                    new_width = placeholder_width
-                    new_height = int(placeholder_width / img_aspect)
-                else:
-                    # 画像が縦長 → 高さに合わせる
-                    new_height = placeholder_height
-                    new_width = int(placeholder_height * img_aspect)
-
-                # 中央揃えのオフセット計算
-                left = placeholder_left + (placeholder_width - new_width) // 2
-                top = placeholder_top + (placeholder_height - new_height) // 2
-
-                sp = shape._element
-                sp.getparent().remove(sp)
-
-                slide.shapes.add_picture(image_data, left, top, new_width, new_height)
-                return True
-    return False
-
-
-def replace_image_placeholder_with_text(slide, placeholder_text, replacement_text):
+    placeholder_left, placeholder_top = shape.left, shape.top
+    placeholder_width, placeholder_height = shape.width, shape.height
+    placeholder_aspect = placeholder_width / placeholder_height
+
+    # アスペクト比を維持してプレースホルダー内に収める
+    if img_aspect > placeholder_aspect:
+        # 画像が横長 → 幅に合わせる
+        new_width = placeholder_width
+        new_height = int(placeholder_width / img_aspect)
+    else:
+        # 画像が縦長 → 高さに合わせる
+        new_height = placeholder_height
+        new_width = int(placeholder_height * img_aspect)
+
+    # 中央揃えのオフセット計算
+    left = placeholder_left + (placeholder_width - new_width) // 2
+    top = placeholder_top + (placeholder_height - new_height) // 2
+
+    return shape, image, left, top, new_width, new_height
+
+
+def place_image(slide, placement, get_image_part):
+    """
+    fit_image の結果に従い、プレースホルダーを実画像で置換
+    get_image_part は cached_image_parts が返す関数（読み込み済みの画像 → 画像パート）
+    """
+    shape, image, left, top, width, height = placement
+
+    sp = shape._element
+    sp.getparent().remove(sp)
+
+    # add_picture と同じ手順（画像パートの取得 → スライドとの関連付け → pic要素の追加）
+    image_part = get_image_part(image)
+    rId = slide.part.relate_to(image_part, RT.IMAGE)
+    slide.shapes._add_pic_from_image_part(image_part, rId, left, top, width, height)
+
+
+@contextlib.contextmanager
+def cached_image_parts(prs):
+    """
+    画像追加時のパッケージ全走査を省く（with ブロック内のみ有効）
+    python-pptxは画像を1枚追加するたびに全パーツを走査して、重複画像と次の
+    画像パート名（/ppt/media/imageN）を探すため、ページ数に対して二乗で遅くなる。
+    既存の画像パートを1回だけ走査し、以降はSHA1の辞書と連番で払い出す。
+    with で受け取る関数（pptx画像 → 画像パート）を place_image に渡す。
+    python-pptxの非公開APIを差し替えるため、requirements.txt で 1.0.x に固定している。
+    """
+    package = prs.part.package
+
+    parts_by_sha1 = {}
+    used_idxs = set()
+    for part in package.iter_parts():
+        if part.partname.startswith('/ppt/media/image') and part.partname.idx is not None:
+            used_idxs.add(part.partname.idx)
+        if isinstance(part, ImagePart):
+            parts_by_sha1.setdefault(part.sha1, part)
+
+    next_idx = 1
+
+    def next_image_partname(ext):
+        # python-pptxと同じく空いている最小の番号を使う（追加のみなので前進するだけでよい）
+        nonlocal next_idx
+        while next_idx in used_idxs:
+            next_idx += 1
+        used_idxs.add(next_idx)
+        return PackURI(f'/ppt/media/image{next_idx}.{ext}')
+
+    def get_or_add_image_part(image):
+        # convert_image_for_pptx で読み込み済みの画像を受け取る
+        part = parts_by_sha1.get(image.sha1)
+        if part is None:
+            part = ImagePart.new(package, image)
+            parts_by_sha1[image.sha1] = part
+        return part
+
+    package.next_image_partname = next_image_partname
+    try:
+        yield get_or_add_image_part
+    finally:
+        del package.next_image_partname
+
+
+def replace_image_placeholder_with_text(index, placeholder_text, replacement_text):
     """画像プレースホルダーをテキストで置換（画像がない場合用）"""
-    for shape in slide.shapes:
-        if shape.has_text_frame:
-            # 全runを結合してチェック
-            text = ''.join([
-                ''.join([run.text for run in p.runs])
-                for p in shape.text_frame.paragraphs
-            ])
-            if placeholder_text in text:
-                # プレースホルダーを置換テキストに変更
-                for paragraph in shape.text_frame.paragraphs:
-                    full_text = ''.join([run.text for run in paragraph.runs])
-                    if placeholder_text in full_text:
-                        new_text = full_text.replace(placeholder_text, replacement_text)
-                        if paragraph.runs:
-                            paragraph.runs[0].text = new_text
-                            for run in paragraph.runs[1:]:
-                                run.text = ''
-                return True
-    return False
-
-
-def build_replacements(product, num, supplier_name):
-    """商品データから置換辞書を生成"""
-    # 列名（改行を含む）
-    price_col = '国内定価\n（15％）'
-    msrp_col = '参考上代\n（税込)'
-
-    msrp_val = product[msrp_col]
-    msrp_str = f"{format_price(msrp_val)}（税込）" if pd.notna(msrp_val) else '－'
+    shape = index.get(placeholder_text)
+    if shape is None:
+        return False
+
+    # プレースホルダーを置換テキストに変更
+    for paragraph in shape.text_frame.paragraphs:
+        full_text = ''.join([run.text for run in paragraph.runs])
+        if placeholder_text in full_text:
+            new_text = full_text.replace(placeholder_text, replacement_text)
+            if paragraph.runs:
+                paragraph.runs[0].text = new_text
+                for run in paragraph.runs[1:]:
+                    run.text = ''
+    return True
+
 
+@functools.lru_cache(maxsize=4096)
+def build_replacements(row, num, supplier_name):
+    """
+    商品データ（PRODUCT_COLS順のタプル）から置換辞書を生成
+    同じ商品の再生成ではキャッシュを返すため、戻り値は変更しないこと
+    """
+    msrp_val = row[COL[MSRP_COL]]
+    msrp_str = f"{format_price(msrp_val)}（税込）" if not is_missing(msrp_val) else '－'
+
+    keys = KEYS_BY_NUM[num]
     return {
         '{{仕入先名}}': supplier_name,
-        f'{{{{商品名_{num}}}}}': safe_str(product['商品名']),
-        f'{{{{容量_{num}}}}}': safe_str(product['容量']),
-        f'{{{{単位_{num}}}}}': safe_str(product['単位']),
-        f'{{{{MOQ_{num}}}}}': safe_str(product['発注ロット']),
-        f'{{{{温度帯_{num}}}}}': safe_str(product['温度帯']),
-        f'{{{{賞味期限_{num}}}}}': safe_str(product['賞味期限']),
-        f'{{{{価格_{num}}}}}': format_price(product[price_col]),
-        f'{{{{参考上代_{num}}}}}': msrp_str,
-        f'{{{{商品説明_{num}}}}}': safe_str(product['商品特徴'], ''),
+        keys['商品名']: safe_str(row[COL['商品名']]),
+        keys['容量']: safe_str(row[COL['容量']]),
+        keys['単位']: safe_str(row[COL['単位']]),
+        keys['MOQ']: safe_str(row[COL['発注ロット']]),
+        keys['温度帯']: safe_str(row[COL['温度帯']]),
+        keys['賞味期限']: safe_str(row[COL['賞味期限']]),
+        keys['価格']: format_price(row[COL[PRICE_COL]]),
+        keys['参考上代']: msrp_str,
+        keys['商品説明']: safe_str(row[COL['商品特徴']], ''),
     }
 
 
-def duplicate_slide(prs, slide_index):
-    """スライドを複製（スライドマスター・レイアウトを維持）"""
-    source_slide = prs.slides[slide_index]
-    slide_layout = source_slide.slide_layout
+def serialize_slide_shapes(slide):
+    """スライドの各シェイプをXMLバイト列に変換（複製用に1回だけ行う）"""
+    return [etree.tostring(shape.element) for shape in slide.shapes]
 
+
+def duplicate_slide(prs, slide_layout, shape_xmls):
+    """スライドを複製（スライドマスター・レイアウトを維持）"""
     new_slide = prs.slides.add_slide(slide_layout)
 
-    # 元スライドの要素をコピー
-    for shape in source_slide.shapes:
-        el = shape.element
-        new_el = copy.deepcopy(el)
+    # 元スライドの要素をXMLから復元（python-pptxの要素クラスで再構築）
+    for xml in shape_xmls:
+        new_el = parse_xml(xml)
         new_slide.shapes._spTree.insert_element_before(new_el, 'p:extLst')
 
     return new_slide
 
 
-def generate_catalog(supplier_code, excel_path, template_path, images_dir, output_dir):
-    """カタログ生成メイン処理"""
+def fill_page(slide, page_rows, supplier_name, images, webp_to_png=False):
+    """
+    1ページ分のテキスト置換と画像配置の計算
+    戻り値: 配置する画像のリスト（追加は呼び出し側で行う）
+    """
+    # 置換辞書を構築
+    replacements = {'{{仕入先名}}': supplier_name}
+    
+    for idx, row in enumerate(page_rows):
+        num = idx + 1
+        replacements.update(build_replacements(row, num, supplier_name))
+    
+    # 2商品目がない場合は空欄に
+    if len(page_rows) < 2:
+        for key in KEYS_BY_NUM[2].values():
+            replacements[key] = ''
+    
+    # テキスト置換
+    pattern = compile_placeholders(frozenset(replacements))
+    for shape in slide.shapes:
+        if shape.has_table:
+            replace_text_in_table(shape.table, replacements, pattern)
+        else:
+            replace_text_in_shape(shape, replacements, pattern)
+    
+    # 画像置換（プレースホルダーの位置はスライド1回の走査で把握）
+    index = index_slide(slide)
+    placements = []
+    for idx, row in enumerate(page_rows):
+        num = idx + 1
+        image_path = images.get(row[COL['商品連番']])
+        if image_path:
+            placement = fit_image(index, KEYS_BY_NUM[num]['画像'], image_path, webp_to_png)
+            if placement:
+                placements.append(placement)
+                # 画像で置き換えるシェイプは削除されるため、同じシェイプ内の他の
+                # プレースホルダーは対象外にする（1つのシェイプに画像_1と画像_2がある場合）
+                shape = placement[0]
+                index = {k: v for k, v in index.items() if v is not shape}
+        else:
+            # 画像がない場合は "no image" を表示
+            replace_image_placeholder_with_text(index, KEYS_BY_NUM[num]['画像'], 'no image')
+    
+    return placements
 
-    # データ読み込み
-    products, supplier_name = load_data(excel_path, supplier_code)
-    print(f"仕入先: {supplier_name}")
-    print(f"商品数: {len(products)}件")
 
-    if len(products) == 0:
-        print("エラー: 対象商品がありません")
-        return None
+class CatalogGenerator:
+    """
+    商品マスタ・テンプレート・画像一覧を1回だけ読み込み、仕入先ごとにカタログを生成
+    サーバーモードで連続生成する場合も読み込みコストは初回のみ
+    （起動後に更新したExcel・画像は再起動まで反映されない）
+    """
 
-    # テンプレートを直接使用（スライドマスター・ロゴを維持）
-    prs = Presentation(template_path)
-
-    # 必要なページ数を計算し、先にスライドを複製（置換前にコピーするため）
-    num_pages = (len(products) + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
-    for _ in range(num_pages - 1):
-        duplicate_slide(prs, 0)
-
-    # ページごとに処理
-    for page_num, page_idx in enumerate(range(0, len(products), PRODUCTS_PER_PAGE)):
-        page_products = products.iloc[page_idx:page_idx + PRODUCTS_PER_PAGE]
-        slide = prs.slides[page_num]
-        
-        # 置換辞書を構築
-        replacements = {'{{仕入先名}}': supplier_name}
-        
-        for idx, (_, product) in enumerate(page_products.iterrows()):
-            num = idx + 1
-            replacements.update(build_replacements(product, num, supplier_name))
-        
-        # 2商品目がない場合は空欄に
-        if len(page_products) < 2:
-            for key in ['商品名', '容量', '単位', 'MOQ', '温度帯', '賞味期限', '価格', '参考上代', '商品説明']:
-                replacements[f'{{{{{key}_2}}}}'] = ''
-            replacements['{{画像_2}}'] = ''
-        
-        # テキスト置換
-        for shape in slide.shapes:
-            if shape.has_table:
-                replace_text_in_table(shape.table, replacements)
-            else:
-                replace_text_in_shape(shape, replacements)
-        
-        # 画像置換
-        for idx, (_, product) in enumerate(page_products.iterrows()):
-            num = idx + 1
-            product_id = product['商品連番']
-            image_path = None
-
-            # 対応形式: jpg, png, webp
-            for ext in ['jpg', 'png', 'webp']:
-                candidate = os.path.join(images_dir, f"{product_id}.{ext}")
-                if os.path.exists(candidate):
-                    image_path = candidate
-                    break
-
-            if image_path:
-                find_and_replace_image(slide, f'{{{{画像_{num}}}}}', image_path)
-            else:
-                # 画像がない場合は "no image" を表示
-                replace_image_placeholder_with_text(slide, f'{{{{画像_{num}}}}}', 'no image')
-    
-    # 保存
-    os.makedirs(output_dir, exist_ok=True)
-    date_str = datetime.now().strftime('%Y%m%d')
-    output_filename = f"カタログ_{supplier_name}_{date_str}.pptx"
-    output_path = os.path.join(output_dir, output_filename)
-
-    prs.save(output_path)
-    print(f"\n生成完了: {output_path}")
-    
-    return output_path
+    def __init__(self, excel_path, template_path, images_dir, output_dir, webp_to_png=False):
+        self.master = read_master(excel_path)
+        # 生成ごとに書き換えるため、テンプレートはバイト列で保持して毎回そこから開く
+        with open(template_path, 'rb') as f:
+            self.template_blob = f.read()
+        # 画像の場所を先に把握（商品ごとのファイル存在確認を省く）
+        self.images = index_images(images_dir)
+        self.output_dir = output_dir
+        self.webp_to_png = webp_to_png
+        # WebPをそのまま埋め込む場合のみpython-pptxに登録する
+        if not webp_to_png:
+            register_webp_support()
+
+    def emit(self, supplier_code):
+        """仕入先1件分のカタログを生成"""
+        products, supplier_name = select_products(self.master, supplier_code)
+        print(f"仕入先: {supplier_name}")
+        print(f"商品数: {len(products)}件")
+
+        if len(products) == 0:
+            print(f"エラー: {supplier_code} の対象商品がありません", file=sys.stderr)
+            return None
+
+        # テンプレートを直接使用（スライドマスター・ロゴを維持）
+        prs = Presentation(io.BytesIO(self.template_blob))
+
+        # 必要なページ数を計算し、先にスライドを複製（置換前にコピーするため）
+        num_pages = (len(products) + PRODUCTS_PER_PAGE - 1) // PRODUCTS_PER_PAGE
+        template_slide = prs.slides[0]
+        shape_xmls = serialize_slide_shapes(template_slide)
+        for _ in range(num_pages - 1):
+            duplicate_slide(prs, template_slide.slide_layout, shape_xmls)
+
+        # 使う列だけをタプルのリストに変換（行ごとのpandasアクセスを避ける）
+        rows = list(products[PRODUCT_COLS].itertuples(index=False, name=None))
+
+        # ページごとに置換し、画像を配置
+        with cached_image_parts(prs) as get_image_part:
+            for page_num, page_idx in enumerate(range(0, len(products), PRODUCTS_PER_PAGE)):
+                slide = prs.slides[page_num]
+                page_rows = rows[page_idx:page_idx + PRODUCTS_PER_PAGE]
+                for placement in fill_page(slide, page_rows, supplier_name,
+                                           self.images, self.webp_to_png):
+                    place_image(slide, placement, get_image_part)
+
+        # 保存
+        os.makedirs(self.output_dir, exist_ok=True)
+        date_str = datetime.now().strftime('%Y%m%d')
+        output_filename = f"カタログ_{supplier_name}_{date_str}.pptx"
+        output_path = os.path.join(self.output_dir, output_filename)
+
+        prs.save(output_path)
+        print(f"\n生成完了: {output_path}")
+
+        return output_path
+
+
+def generate_catalog(supplier_code, excel_path, template_path, images_dir, output_dir,
+                     webp_to_png=False):
+    """カタログ生成メイン処理"""
+    generator = CatalogGenerator(excel_path, template_path, images_dir, output_dir, webp_to_png)
+    return generator.emit(supplier_code)
 
 
 def main():
     parser = argparse.ArgumentParser(description='商品カタログ生成')
-    parser.add_argument('supplier_code', help='仕入先コード（例: HAK）')
+    parser.add_argument('supplier_code', nargs='?', help='仕入先コード（例: HAK）')
     parser.add_argument('--excel', default=DEFAULT_EXCEL, help='Excelファイルパス')
     parser.add_argument('--template', default=DEFAULT_TEMPLATE, help='テンプレートファイルパス')
     parser.add_argument('--images', default=DEFAULT_IMAGES_DIR, help='画像ディレクトリ')
     parser.add_argument('--output', default=DEFAULT_OUTPUT_DIR, help='出力ディレクトリ')
+    parser.add_argument('--webp-to-png', action='store_true',
+                        help='WebP画像をPNGに変換して埋め込む（PowerPoint 2019以前向け）')
+    parser.add_argument('--server', action='store_true',
+                        help='標準入力から仕入先コードを1行ずつ受け取り連続生成')
     
     args = parser.parse_args()
+    if not args.server and not args.supplier_code:
+        parser.error('仕入先コードを指定してください（連続生成は --server）')
+    if args.server and args.supplier_code:
+        parser.error('--server では仕入先コードを標準入力から渡してください')
     
-    generate_catalog(
-        args.supplier_code,
+    generator = CatalogGenerator(
         args.excel,
         args.template,
         args.images,
-        args.output
+        args.output,
+        args.webp_to_png,
     )
+    
+    if not args.server:
+        generator.emit(args.supplier_code)
+        return
+    
+    # サーバーモード: 読み込み済みのデータを使い回して1行1仕入先ずつ生成
+    # 失敗した仕入先はエラーを出して次へ進み、最後に終了コードで知らせる
+    failed = []
+    while line := sys.stdin.readline():
+        supplier_code = line.strip()
+        if not supplier_code:
+            continue
+        try:
+            # 対象商品がない（コードの誤りなど）場合も失敗として扱う
+            if generator.emit(supplier_code) is None:
+                failed.append(supplier_code)
+        except Exception as e:
+            print(f"エラー: {supplier_code} の生成に失敗しました: {type(e).__name__}: {e}",
+                  file=sys.stderr)
+            failed.append(supplier_code)
+        sys.stdout.flush()
+
+    if failed:
+        sys.exit(f"失敗した仕入先: {', '.join(failed)}")
 
 
 if __name__ == '__main__':